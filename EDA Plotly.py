@@ -1,34 +1,86 @@
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, dcc, html, Input, Output, State
 import dash_bootstrap_components as dbc
-import plotly.express as px
+import plotly.io as pio
+
+from retail_data import MAX_LINE_POINTS, count_distinct, isin_codes, load_data, lttb_indices, month_label
+
 
 # =======================
 # Load & prepare data
 # =======================
-df = pd.read_csv("online_retail_data.csv")
-
-df["order_date"] = pd.to_datetime(df["order_date"])
-df["revenue"] = df["quantity"] * df["price"]
-df["profit"] = df["revenue"] * 0.30  # 30% margin, cost = 70%
-df["year_month"] = df["order_date"].dt.to_period("M").astype(str)
-
-# Age groups for segmentation
-df["age_group"] = pd.cut(
-    df["age"],
-    bins=[18, 30, 45, 60, 80],
-    labels=["18-30", "31-45", "46-60", "60+"]
+df = load_data()
+
+# Pre-aggregated cube: revenue & order counts per (day, category, month, age
+# group, gender), indexed by the two filter keys. Callbacks slice it by date
+# range and category instead of re-filtering and re-grouping the raw rows.
+# dropna=False keeps orders with a missing gender/age in the totals.
+cube = (
+    df.groupby(
+        ["order_date", "category_name", "year_month", "age_group", "gender"],
+        observed=True,
+        sort=False,
+        dropna=False,
+    )
+    .agg(revenue=("revenue", "sum"), orders=("revenue", "size"))
+    .reset_index()
+    .set_index(["order_date", "category_name"])
+    .sort_index()
+)
+
+# Each cube row also stores the flat position of its (month, category, age
+# group, gender) cell in a small dense array; slot 0 of the age and gender
+# axes holds missing values. A callback sums any slice into that array with
+# one np.bincount per measure, and every chart is then an axis-sum of it.
+first_month = int(df["year_month"].min())
+cell_shape = (
+    int(df["year_month"].max()) - first_month + 1,
+    len(df["category_name"].cat.categories),
+    len(df["age_group"].cat.categories) + 1,
+    len(df["gender"].cat.categories) + 1,
 )
+n_cells = int(np.prod(cell_shape))
+cube["cell"] = np.ravel_multi_index(
+    (
+        cube["year_month"].to_numpy() - first_month,
+        cube.index.get_level_values("category_name").codes,
+        cube["age_group"].cat.codes.to_numpy() + 1,
+        cube["gender"].cat.codes.to_numpy() + 1,
+    ),
+    cell_shape,
+)
+
+# The columns the callback touches, held as contiguous NumPy arrays so the
+# hot path walks plain int codes and floats instead of pandas objects: the
+# date-sorted raw rows for the filter and the distinct-customer count, and
+# the cube's cell codes and measures for everything else
+order_dates = df["order_date"].to_numpy()
+category_codes = df["category_name"].cat.codes.to_numpy()
+customer_codes = df["customer_id"].cat.codes.to_numpy()
+n_customers = len(df["customer_id"].cat.categories)
+cube_cells = cube["cell"].to_numpy()
+cube_revenue = cube["revenue"].to_numpy()
+cube_orders = cube["orders"].to_numpy()
 
 min_date = df["order_date"].min()
 max_date = df["order_date"].max()
 
-all_categories = sorted(df["category_name"].unique())
-all_cities = sorted(df["city"].unique())
-all_genders = sorted(df["gender"].dropna().unique())
+all_categories = df["category_name"].cat.categories.tolist()
+all_genders = df["gender"].cat.categories.tolist()
 all_age_groups = list(df["age_group"].cat.categories)
 
 PLOT_TEMPLATE = "simple_white"
+PROFIT_MARGIN = 0.30  # 30% margin, cost = 70%
+
+
+@lru_cache(maxsize=256)
+def parse_date(value):
+    """Parse a DatePickerRange value once; users revisit the same few dates."""
+    return pd.Timestamp(value)
+
 
 # =======================
 # Dash app
@@ -217,13 +269,114 @@ app.layout = dbc.Container(
         html.Br(),
         html.Div("Designed for portfolio/demo use – tweak colors & texts to match your style.",
                  className="text-muted small"),
+
+        # Chart series from the server callback, and the plot template the
+        # clientside callback draws them with
+        dcc.Store(id="chart-data"),
+        dcc.Store(id="plot-template", data=pio.templates[PLOT_TEMPLATE].to_plotly_json()),
     ],
 )
 
+# =======================
+# Aggregations (memoized per filter selection)
+# =======================
+
+# Dash re-fires the callback for selections users have already seen (focus
+# changes, going back to a previous range); those skip the filtering and
+# aggregation entirely. The returned frames are shared between calls and
+# must be treated as read-only.
+@lru_cache(maxsize=512)
+def summarise(start, end, categories):
+    """KPIs and chart frames for one filter selection, or None if nothing matches."""
+    # Filter: df is sorted by order_date, so the (inclusive) date range is a
+    # contiguous row slice found by binary search. Everything except the
+    # distinct-customer count comes from the cube, so only the customer codes
+    # of the matching rows are gathered – never a copy of the whole frame.
+    lo = order_dates.searchsorted(start.to_datetime64(), side="left")
+    hi = order_dates.searchsorted(end.to_datetime64(), side="right")
+    customers = customer_codes[lo:hi]
+    if categories:
+        customers = customers[isin_codes(category_codes[lo:hi], df["category_name"].cat.categories, categories)]
+    if customers.size == 0:
+        return None
+
+    # ---- Cube slice ----
+    # One bincount pass per measure folds the matching cube rows into the
+    # dense month × category × age × gender cell arrays; every KPI and chart
+    # below is an axis-sum over these small arrays instead of a groupby.
+    date_slice = slice(start, end)
+    # Label lookups raise on labels missing from the index, so drop unknown categories
+    category_slice = cube.index.levels[1].intersection(categories) if categories else slice(None)
+    rows = cube.index.get_locs([date_slice, category_slice])
+    cells = cube_cells[rows]
+    revenue = np.bincount(cells, weights=cube_revenue[rows], minlength=n_cells).reshape(cell_shape)
+    orders = np.bincount(cells, weights=cube_orders[rows], minlength=n_cells).reshape(cell_shape)
+
+    total_revenue = revenue.sum()
+    total_orders = int(orders.sum())
+
+    # Chart data is kept as plain lists: it is sent to the browser as-is
+    # through the chart-data store and the figures are drawn client-side
+
+    # Sales over time
+    months = np.flatnonzero(orders.sum(axis=(1, 2, 3)))  # months with orders, in order
+    monthly_revenue = revenue.sum(axis=(1, 2, 3))[months]
+    keep = lttb_indices(monthly_revenue, MAX_LINE_POINTS)
+    monthly = {
+        "x": month_label(pd.Series(first_month + months[keep])).tolist(),
+        "y": monthly_revenue[keep].tolist(),
+    }
+
+    # Avg sales value by category, highest first
+    cat_orders = orders.sum(axis=(0, 2, 3))
+    cat_codes = np.flatnonzero(cat_orders)
+    cat_means = revenue.sum(axis=(0, 2, 3))[cat_codes] / cat_orders[cat_codes]
+    by_mean = np.argsort(-cat_means, kind="stable")
+    cat_avg = {
+        "x": df["category_name"].cat.categories[cat_codes[by_mean]].tolist(),
+        "y": cat_means[by_mean].tolist(),
+    }
+
+    # Age × gender, one bar series per gender. Slot 0 (missing age/gender)
+    # is left out
+    seg_revenue = revenue[:, :, 1:, 1:].sum(axis=(0, 1))
+    seg_orders = orders[:, :, 1:, 1:].sum(axis=(0, 1))
+    seg = []
+    for g, gender in enumerate(df["gender"].cat.categories):
+        ages = np.flatnonzero(seg_orders[:, g])
+        if ages.size:
+            seg.append(
+                {
+                    "name": gender,
+                    "x": df["age_group"].cat.categories[ages].tolist(),
+                    "y": seg_revenue[ages, g].tolist(),
+                }
+            )
+
+    return {
+        "total_revenue": total_revenue,
+        "total_profit": total_revenue * PROFIT_MARGIN,
+        "avg_order_value": total_revenue / total_orders,
+        "num_orders": total_orders,
+        # Distinct customers can't be summed across cube cells, so count them on the raw rows
+        "num_customers": count_distinct(customers, n_customers),
+        "charts": {"monthly": monthly, "cat_avg": cat_avg, "seg": seg},
+    }
+
+
+# Warm the cache with the page's initial selection (full date range, every
+# category) at import time, so the first page load is a cache hit rather
+# than a cold aggregation
+summarise(min_date, max_date, tuple(sorted(all_categories)))
+
+
 # =======================
 # Callbacks
 # =======================
 
+# The server callback only computes the KPIs and the small chart series; the
+# series go to the browser through the chart-data store and the three
+# figures are assembled there by the clientside callback below.
 @app.callback(
     [
         # KPI outputs
@@ -232,10 +385,8 @@ app.layout = dbc.Container(
         Output("kpi-aov", "children"),
         Output("kpi-orders", "children"),
         Output("kpi-customers", "children"),
-        # Charts
-        Output("graph-monthly-revenue", "figure"),
-        Output("graph-category-revenue", "figure"),
-        Output("graph-age-gender", "figure"),
+        # Chart series
+        Output("chart-data", "data"),
     ],
     [
         Input("date-range", "start_date"),
@@ -249,133 +400,100 @@ def update_dashboard(start_date, end_date, categories):
     if end_date is None:
         end_date = max_date
 
-    # Filter
-    filtered = df.copy()
-    filtered = filtered[
-        filtered["order_date"].between(pd.to_datetime(start_date), pd.to_datetime(end_date))
-    ]
-    if categories:
-        filtered = filtered[filtered["category_name"].isin(categories)]
+    # Selections are passed as a sorted tuple so the cache key is cheap to
+    # hash and order-independent
+    summary = summarise(
+        parse_date(start_date),
+        parse_date(end_date),
+        tuple(sorted(categories)) if categories else None,
+    )
 
-    if filtered.empty:
-        # Empty KPIs
+    if summary is None:
+        # Empty KPIs; the charts show a "no data" placeholder
         def k(label):
             return [
                 html.Div(label, className="text-muted", style={"fontSize": "0.8rem", "textTransform": "uppercase"}),
                 html.Div("—", className="fw-bold", style={"fontSize": "1.6rem"}),
             ]
 
-        empty_fig = px.scatter(title="No data for selected filters", template=PLOT_TEMPLATE)
-        empty_fig.update_layout(margin=dict(t=40, l=20, r=10, b=40))
-
         return (
             k("Total Revenue"),
             k("Total Profit"),
             k("Avg Order Value"),
             k("Total Orders"),
             k("Active Customers"),
-            empty_fig,
-            empty_fig,
-            empty_fig,
+            None,
         )
 
     # ---- KPIs ----
-    total_revenue = filtered["revenue"].sum()
-    total_profit = filtered["profit"].sum()
-    avg_order_value = filtered["revenue"].mean()
-    total_orders = len(filtered)
-    active_customers = filtered["customer_id"].nunique()
-
     def kpi_block(label, value):
         return [
             html.Div(label, className="text-muted", style={"fontSize": "0.8rem", "textTransform": "uppercase"}),
             html.Div(value, className="fw-bold", style={"fontSize": "1.6rem"}),
         ]
 
-    kpi_total_revenue = kpi_block("Total Revenue", f"${total_revenue:,.1f}")
-    kpi_total_profit = kpi_block("Total Profit", f"${total_profit:,.1f}")
-    kpi_aov = kpi_block("Avg Order Value", f"${avg_order_value:,.1f}")
-    kpi_orders = kpi_block("Total Sales", f"{total_orders:,}")
-    kpi_customers = kpi_block("Active Customers", f"{active_customers:,}")
-
-    # ---- Chart 1: Sales Over Time (line) ----
-    monthly = (
-        filtered.groupby("year_month")["revenue"]
-        .sum()
-        .reset_index()
-        .sort_values("year_month")
-    )
-    fig_monthly = px.line(
-        monthly,
-        x="year_month",
-        y="revenue",
-        markers=True,
-        template=PLOT_TEMPLATE,
-    )
-    fig_monthly.update_layout(
-        xaxis_title="Month",
-        yaxis_title="Revenue",
-        margin=dict(t=20, l=40, r=20, b=40),
+    return (
+        kpi_block("Total Revenue", f"${summary['total_revenue']:,.1f}"),
+        kpi_block("Total Profit", f"${summary['total_profit']:,.1f}"),
+        kpi_block("Avg Order Value", f"${summary['avg_order_value']:,.1f}"),
+        kpi_block("Total Sales", f"{summary['num_orders']:,}"),
+        kpi_block("Active Customers", f"{summary['num_customers']:,}"),
+        summary["charts"],
     )
 
-    # ---- Chart 2: Avg Sales Value by Category ----
-    cat_avg = (
-        filtered.groupby("category_name")["revenue"]
-        .mean()
-        .reset_index()
-        .sort_values("revenue", ascending=False)
-    )
-    fig_cat = px.bar(
-        cat_avg,
-        x="category_name",
-        y="revenue",
-        template=PLOT_TEMPLATE,
-    )
-    fig_cat.update_layout(
-        xaxis_title="Category",
-        yaxis_title="Avg Revenue per Order",
-        margin=dict(t=20, l=40, r=20, b=80),
-    )
 
-    # ---- Chart 3: Age × Gender stacked area / grouped bar ----
-    seg = (
-        filtered.groupby(["year_month", "age_group", "gender"])["revenue"]
-        .sum()
-        .reset_index()
-    )
+# Builds the three figures in the browser from the chart-data series and the
+# plot template (shipped once with the layout)
+app.clientside_callback(
+    """
+    function (data, template) {
+        function layout(extra) {
+            return Object.assign({template: template, margin: {t: 20, l: 40, r: 20, b: 40}}, extra);
+        }
+        function titles(x, y) {
+            return {xaxis: {title: {text: x}}, yaxis: {title: {text: y}}};
+        }
 
-    # For simplicity & clarity, grouped bar by Age × Gender (over all time)
-    seg2 = (
-        filtered.groupby(["age_group", "gender"])["revenue"]
-        .sum()
-        .reset_index()
-    )
-    fig_seg = px.bar(
-        seg2,
-        x="age_group",
-        y="revenue",
-        color="gender",
-        barmode="group",
-        template=PLOT_TEMPLATE,
-    )
-    fig_seg.update_layout(
-        xaxis_title="Age Group",
-        yaxis_title="Revenue",
-        margin=dict(t=20, l=40, r=20, b=40),
-        legend_title="Gender",
-    )
+        if (!data) {
+            const empty = {
+                data: [],
+                layout: {template: template, title: {text: "No data for selected filters"}, margin: {t: 40, l: 20, r: 10, b: 40}},
+            };
+            return [empty, empty, empty];
+        }
 
-    return (
-        kpi_total_revenue,
-        kpi_total_profit,
-        kpi_aov,
-        kpi_orders,
-        kpi_customers,
-        fig_monthly,
-        fig_cat,
-        fig_seg,
-    )
+        // ---- Chart 1: Sales Over Time (line) ----
+        const monthly = {
+            data: [{type: "scatter", mode: "lines+markers", x: data.monthly.x, y: data.monthly.y}],
+            // uirevision keeps zoom/pan across filter updates
+            layout: layout(Object.assign(titles("Month", "Revenue"), {uirevision: "monthly-revenue"})),
+        };
+
+        // ---- Chart 2: Avg Sales Value by Category ----
+        const category = {
+            data: [{type: "bar", x: data.cat_avg.x, y: data.cat_avg.y}],
+            layout: layout(Object.assign(titles("Category", "Avg Revenue per Order"), {margin: {t: 20, l: 40, r: 20, b: 80}})),
+        };
 
+        // ---- Chart 3: Age × Gender grouped bar ----
+        const segment = {
+            data: data.seg.map(function (s) {
+                return {type: "bar", name: s.name, x: s.x, y: s.y};
+            }),
+            layout: layout(Object.assign(titles("Age Group", "Revenue"), {barmode: "group", legend: {title: {text: "Gender"}}})),
+        };
+
+        return [monthly, category, segment];
+    }
+    """,
+    [
+        Output("graph-monthly-revenue", "figure"),
+        Output("graph-category-revenue", "figure"),
+        Output("graph-age-gender", "figure"),
+    ],
+    Input("chart-data", "data"),
+    State("plot-template", "data"),
+)
 
 if __name__ == "__main__":
     app.run_server(debug=True)
\ No newline at end of file
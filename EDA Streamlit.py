@@ -1,6 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import streamlit as st
 
+from retail_data import MAX_LINE_POINTS, count_distinct, isin_codes, load_data, lttb_indices, month_label
+
 # Try importing plotly and fail gracefully if it's missing
 try:
     import plotly.express as px
@@ -35,24 +39,6 @@ st.markdown(
             padding-top: 1.5rem;
             padding-bottom: 1.5rem;
         }
-        .kpi-card {
-            padding: 0.9rem 1.1rem;
-            border-radius: 0.8rem;
-            background-color: #ffffff;
-            box-shadow: 0 4px 12px rgba(15, 23, 42, 0.06);
-            border: 1px solid rgba(148, 163, 184, 0.15);
-            margin-bottom: 0.8rem;
-        }
-        .kpi-label {
-            font-size: 0.75rem;
-            text-transform: uppercase;
-            color: #6b7280;
-        }
-        .kpi-value {
-            font-size: 1.6rem;
-            font-weight: 600;
-            color: #111827;
-        }
     </style>
     """,
     unsafe_allow_html=True
@@ -62,28 +48,42 @@ st.markdown(
 # 2. Load & prepare data
 # ======================================================
 
-@st.cache_data
-def load_data():
-    df = pd.read_csv("online_retail_data.csv")
-
-    df["order_date"] = pd.to_datetime(df["order_date"])
-    df["revenue"] = df["quantity"] * df["price"]
-    df["profit"] = df["revenue"] * 0.30  # 30% margin, cost = 70%
-
-    # Age groups for segmentation
-    df["age_group"] = pd.cut(
-        df["age"],
-        bins=[18, 30, 45, 60, 80],
-        labels=["18-30", "31-45", "46-60", "60+"]
+PROFIT_MARGIN = 0.30  # 30% margin, cost = 70%
+
+
+# cache_resource hands every rerun the same objects without hashing or
+# copying them – callers must treat df and cube as read-only
+@st.cache_resource
+def load_cube():
+    df = load_data()
+
+    # Pre-aggregated cube over every filter dimension. Filters and charts run
+    # on these partial sums instead of on the raw order rows. Keyed by day
+    # (not month) so the date-range filter stays exact. dropna=False keeps
+    # orders with a missing key (e.g. a blank city) in the totals, exactly as
+    # the raw rows the customer count is taken from.
+    cube = (
+        df.groupby(
+            ["order_date", "year_month", "category_name", "gender", "age_group", "city"],
+            observed=True,
+            sort=False,
+            dropna=False,
+        )
+        .agg(revenue=("revenue", "sum"), orders=("revenue", "size"))
+        .reset_index()
+        .sort_values("order_date", ignore_index=True)
     )
 
-    # Month-Year for trends
-    df["year_month"] = df["order_date"].dt.to_period("M").astype(str)
+    # Sidebar metadata, computed once here instead of scanning df on every rerun
+    filter_options = {
+        "date_range": (df["order_date"].min(), df["order_date"].max()),
+        **{col: df[col].cat.categories.tolist() for col in ("category_name", "gender", "age_group", "city")},
+    }
 
-    return df
+    return df, cube, filter_options
 
 
-df = load_data()
+df, cube, filter_options = load_cube()
 
 # ======================================================
 # 3. Header
@@ -99,8 +99,7 @@ st.markdown("---")
 
 st.sidebar.header("🔍 Filters")
 
-min_date = df["order_date"].min()
-max_date = df["order_date"].max()
+min_date, max_date = filter_options["date_range"]
 
 date_range = st.sidebar.date_input(
     "Order Date Range",
@@ -116,104 +115,170 @@ else:
 
 categories = st.sidebar.multiselect(
     "Product Category",
-    options=sorted(df["category_name"].unique()),
-    default=sorted(df["category_name"].unique()),
+    options=filter_options["category_name"],
+    default=filter_options["category_name"],
 )
 
 genders = st.sidebar.multiselect(
     "Gender",
-    options=sorted(df["gender"].dropna().unique()),
-    default=sorted(df["gender"].dropna().unique()),
+    options=filter_options["gender"],
+    default=filter_options["gender"],
 )
 
 age_groups = st.sidebar.multiselect(
     "Age Group",
-    options=df["age_group"].cat.categories.tolist(),
-    default=df["age_group"].cat.categories.tolist(),
+    options=filter_options["age_group"],
+    default=filter_options["age_group"],
 )
 
-all_cities = sorted(df["city"].unique())
 selected_cities = st.sidebar.multiselect(
     "City (optional – leave empty for all)",
-    options=all_cities,
+    options=filter_options["city"],
     default=[],
 )
 
-# Apply filters
-filtered_df = df[
-    (df["order_date"].between(pd.to_datetime(start_date), pd.to_datetime(end_date)))
-    & (df["category_name"].isin(categories))
-    & (df["gender"].isin(genders))
-    & (df["age_group"].isin(age_groups))
-]
+# Apply filters (works on both the raw rows and the cube, which are both
+# sorted by order_date). The date range is cut out as a contiguous slice by
+# binary search; the remaining predicates are ANDed in place into a single
+# NumPy mask – no Series alignment and no pile of intermediate boolean arrays.
+def mask_isin(col, values):
+    """Membership mask for a categorical column, tested on its integer codes."""
+    return isin_codes(col.cat.codes.to_numpy(), col.cat.categories, values)
+
+
+def apply_filters(frame, start_date, end_date, categories, genders, age_groups, cities):
+    dates = frame["order_date"].to_numpy()
+    lo = dates.searchsorted(pd.Timestamp(start_date).to_datetime64(), side="left")
+    hi = dates.searchsorted(pd.Timestamp(end_date).to_datetime64(), side="right")
+    frame = frame.iloc[lo:hi]
+    mask = mask_isin(frame["category_name"], categories)
+    mask &= mask_isin(frame["gender"], genders)
+    mask &= mask_isin(frame["age_group"], age_groups)
+    if cities:
+        mask &= mask_isin(frame["city"], cities)
+    return frame[mask]
 
-if selected_cities:
-    filtered_df = filtered_df[filtered_df["city"].isin(selected_cities)]
 
 # ======================================================
-# 5. Layout: left KPIs & right charts
+# 5. Aggregations (memoized per filter selection)
+# ======================================================
+
+@st.cache_resource
+def worker_pool():
+    """Threads shared by all sessions for scans that can overlap."""
+    return ThreadPoolExecutor(max_workers=2)
+
+
+# Reruns that don't change the filters (or return to an earlier selection)
+# skip the filtering and groupbys entirely. Selections are passed as sorted
+# tuples so the cache key is cheap to hash and order-independent.
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def summarise(start_date, end_date, categories, genders, age_groups, cities):
+    filters = (start_date, end_date, categories, genders, age_groups, cities)
+    filtered_cube = apply_filters(cube, *filters)
+    if filtered_cube.empty:
+        return None
+
+    # Distinct customers can't be summed across cube cells, so they are
+    # counted on the raw rows – the largest scan here. It runs on a worker
+    # thread while the cube rollups below run on this one (NumPy and pandas'
+    # groupby kernels release the GIL for most of their work).
+    num_customers = worker_pool().submit(
+        lambda: count_distinct(
+            apply_filters(df, *filters)["customer_id"].cat.codes.to_numpy(),
+            len(df["customer_id"].cat.categories),
+        )
+    )
+
+    total_revenue = filtered_cube["revenue"].sum()
+    num_orders = filtered_cube["orders"].sum()
+
+    # groupbys skip their own sort (sort=False); only the small outputs are
+    # sorted for display
+    monthly = (
+        filtered_cube.groupby("year_month", observed=True, sort=False)["revenue"]
+        .sum()
+        .reset_index()
+        .sort_values("year_month")
+    )
+    monthly["year_month"] = month_label(monthly["year_month"])
+    monthly = monthly.iloc[lttb_indices(monthly["revenue"].to_numpy(), MAX_LINE_POINTS)]
+
+    # One groupby feeds both the category total and category average charts
+    by_category = filtered_cube.groupby("category_name", observed=True, sort=False)[["revenue", "orders"]].sum()
+
+    return {
+        "total_revenue": total_revenue,
+        "total_profit": total_revenue * PROFIT_MARGIN,
+        "avg_order_value": total_revenue / num_orders,
+        "num_orders": num_orders,
+        "num_customers": num_customers.result(),
+        "monthly": monthly,
+        "cat_avg": (
+            (by_category["revenue"] / by_category["orders"])
+            .rename("revenue")
+            .reset_index()
+            .sort_values("revenue", ascending=False)
+        ),
+        "seg": (
+            filtered_cube.groupby(["age_group", "gender"], observed=True, sort=False)["revenue"]
+            .sum()
+            .reset_index()
+            .sort_values(["age_group", "gender"])
+        ),
+        "cat_rev": (
+            by_category["revenue"]
+            .reset_index()
+            .sort_values("revenue", ascending=False)
+        ),
+        "city_rev": (
+            filtered_cube.groupby("city", observed=True, sort=False)["revenue"]
+            .sum()
+            .reset_index()
+            .nlargest(10, "revenue")
+        ),
+    }
+
+
+summary = summarise(
+    start_date,
+    end_date,
+    tuple(sorted(categories)),
+    tuple(sorted(genders)),
+    tuple(sorted(age_groups)),
+    tuple(sorted(selected_cities)),
+)
+
+# ======================================================
+# 6. Layout: left KPIs & right charts
 # ======================================================
 
 left_col, right_col = st.columns([1, 3])
 
-# ---------- 5A. KPIs ----------
+# ---------- 6A. KPIs ----------
 with left_col:
     st.subheader("📌 KPIs")
 
-    if filtered_df.empty:
+    if summary is None:
         st.info("No data for selected filters.")
     else:
-        total_revenue = filtered_df["revenue"].sum()
-        total_profit = filtered_df["profit"].sum()
-        avg_order_value = filtered_df["revenue"].mean()
-        num_orders = len(filtered_df)
-        num_customers = filtered_df["customer_id"].nunique()
-
-        def kpi_html(label, value):
-            return f"""
-            <div class="kpi-card">
-                <div class="kpi-label">{label}</div>
-                <div class="kpi-value">{value}</div>
-            </div>
-            """
-
-        st.markdown(
-            kpi_html("Total Revenue", f"${total_revenue:,.1f}"),
-            unsafe_allow_html=True,
-        )
-        st.markdown(
-            kpi_html("Total Profit", f"${total_profit:,.1f}"),
-            unsafe_allow_html=True,
-        )
-        st.markdown(
-            kpi_html("Avg Order Value", f"${avg_order_value:,.1f}"),
-            unsafe_allow_html=True,
-        )
-        st.markdown(
-            kpi_html("Total Orders", f"{num_orders:,}"),
-            unsafe_allow_html=True,
-        )
-        st.markdown(
-            kpi_html("Active Customers", f"{num_customers:,}"),
-            unsafe_allow_html=True,
-        )
-
-# ---------- 5B. Right side charts ----------
+        # Native metric elements – no raw HTML to re-render on every rerun
+        st.metric("Total Revenue", f"${summary['total_revenue']:,.1f}")
+        st.metric("Total Profit", f"${summary['total_profit']:,.1f}")
+        st.metric("Avg Order Value", f"${summary['avg_order_value']:,.1f}")
+        st.metric("Total Orders", f"{summary['num_orders']:,}")
+        st.metric("Active Customers", f"{summary['num_customers']:,}")
+
+# ---------- 6B. Right side charts ----------
 with right_col:
     st.subheader("📈 KPIs & Trends")
 
-    if filtered_df.empty:
+    if summary is None:
         st.info("No data available for selected filters.")
     else:
         # Monthly revenue trend
-        monthly = (
-            filtered_df.groupby("year_month")["revenue"]
-            .sum()
-            .reset_index()
-            .sort_values("year_month")
-        )
         fig_monthly = px.line(
-            monthly,
+            summary["monthly"],
             x="year_month",
             y="revenue",
             title="Sales Over Time",
@@ -225,6 +290,7 @@ with right_col:
             template="simple_white",
             height=260,
             margin=dict(t=40, l=40, r=20, b=40),
+            uirevision="monthly-revenue",  # keep zoom/pan across reruns
         )
 
         top_left, top_right = st.columns(2)
@@ -233,14 +299,8 @@ with right_col:
             st.plotly_chart(fig_monthly, use_container_width=True)
 
         with top_right:
-            cat_avg = (
-                filtered_df.groupby("category_name")["revenue"]
-                .mean()
-                .reset_index()
-                .sort_values("revenue", ascending=False)
-            )
             fig_cat = px.bar(
-                cat_avg,
+                summary["cat_avg"],
                 x="category_name",
                 y="revenue",
                 title="Avg Sales Value by Category",
@@ -255,13 +315,8 @@ with right_col:
             st.plotly_chart(fig_cat, use_container_width=True)
 
         # Bottom wide chart: Age × Gender
-        seg = (
-            filtered_df.groupby(["age_group", "gender"])["revenue"]
-            .sum()
-            .reset_index()
-        )
         fig_seg = px.bar(
-            seg,
+            summary["seg"],
             x="age_group",
             y="revenue",
             color="gender",
@@ -278,7 +333,7 @@ with right_col:
         st.plotly_chart(fig_seg, use_container_width=True)
 
 # ======================================================
-# 6. Extra comparisons
+# 7. Extra comparisons
 # ======================================================
 
 st.markdown("---")
@@ -286,19 +341,13 @@ st.subheader("🧩 Additional Comparisons")
 
 bottom_left, bottom_right = st.columns(2)
 
-if filtered_df.empty:
+if summary is None:
     bottom_left.info("No data for bottom charts with current filters.")
 else:
     with bottom_left:
         st.markdown("#### 🏷 Total Revenue by Category")
-        cat_rev = (
-            filtered_df.groupby("category_name")["revenue"]
-            .sum()
-            .reset_index()
-            .sort_values("revenue", ascending=False)
-        )
         fig_cat_sum = px.bar(
-            cat_rev,
+            summary["cat_rev"],
             x="category_name",
             y="revenue",
             title="Total Revenue by Category",
@@ -314,15 +363,8 @@ else:
 
     with bottom_right:
         st.markdown("#### 🏙 Top 10 Cities by Revenue")
-        city_rev = (
-            filtered_df.groupby("city")["revenue"]
-            .sum()
-            .reset_index()
-            .sort_values("revenue", ascending=False)
-            .head(10)
-        )
         fig_city = px.bar(
-            city_rev,
+            summary["city_rev"],
             x="city",
             y="revenue",
             title="Top 10 Cities by Revenue",
@@ -0,0 +1,168 @@
+import glob
+import hashlib
+import inspect
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.feather as feather
+
+# Data loading and helpers shared by the Dash and Streamlit dashboards
+
+DATA_PATH = "online_retail_data.csv"
+MAX_LINE_POINTS = 200  # longer monthly series are downsampled before plotting
+
+
+# =======================
+# Load & prepare data
+# =======================
+def prepare_data(path):
+    """Parse the raw CSV and add the derived columns used by the dashboards."""
+    # pyarrow's CSV reader tokenises blocks on all cores and writes typed
+    # columns directly (narrow numerics, dictionary-encoded strings)
+    table = pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=64 << 20, use_threads=True),
+        convert_options=pacsv.ConvertOptions(
+            # Only the columns the dashboards use are parsed at all
+            include_columns=[
+                "order_date", "customer_id", "category_name", "city", "gender", "quantity", "price", "age",
+            ],
+            column_types={
+                "order_date": pa.timestamp("ns"),
+                "category_name": pa.dictionary(pa.int32(), pa.string()),
+                "city": pa.dictionary(pa.int32(), pa.string()),
+                "gender": pa.dictionary(pa.int32(), pa.string()),
+                "customer_id": pa.int32(),
+                "quantity": pa.int32(),
+                "price": pa.float64(),
+                "age": pa.int8(),
+            },
+            timestamp_parsers=["%m/%d/%Y"],  # e.g. 12/17/2024
+            strings_can_be_null=True,  # blank gender -> missing
+        ),
+    )
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+
+    # Arrow dictionaries keep first-seen order; sort them so filter options
+    # and chart ordering stay alphabetical
+    for col in ("category_name", "city", "gender"):
+        df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+
+    # Prices and revenue stay float64: float32 can't carry cents through the
+    # six- and seven-figure totals the KPIs show to one decimal. Profit is not
+    # stored per row – it is derived from the revenue totals.
+    df["revenue"] = df["quantity"] * df["price"]
+    # Integer year * 12 + month key; "YYYY-MM" labels are only built for the
+    # aggregated monthly series (see month_label). One cast to datetime64[M]
+    # (months since 1970-01) yields it without extracting year and month
+    # separately
+    months_since_epoch = df["order_date"].to_numpy().astype("datetime64[M]").astype(np.int64)
+    df["year_month"] = (months_since_epoch + (1970 * 12 + 1)).astype(np.int16)
+
+    # Age groups for segmentation: right-closed bins (same as pd.cut) found with
+    # one searchsorted pass over the int8 ages, stored straight as int8 codes
+    age_bins = np.array([18, 30, 45, 60, 80], dtype=np.int8)
+    age_labels = ["18-30", "31-45", "46-60", "60+"]
+    age_codes = np.searchsorted(age_bins, df["age"].to_numpy(), side="left").astype(np.int8) - 1
+    age_codes[age_codes >= len(age_labels)] = -1  # outside the bins -> NaN
+    df["age_group"] = pd.Categorical.from_codes(age_codes, categories=age_labels, ordered=True)
+
+    # quantity, price and age only feed the derived columns above. Rows are
+    # kept in order_date order so a date range can be cut out with two binary
+    # searches instead of a full-column comparison
+    return df.drop(columns=["quantity", "price", "age"]).sort_values("order_date", ignore_index=True)
+
+
+def load_data(path=DATA_PATH):
+    """The prepared frame for path, read from its on-disk cache when there is one."""
+    # The prepared frame is persisted as an uncompressed Arrow IPC (Feather)
+    # file under a hash of the CSV contents and of prepare_data() itself, so a
+    # restart skips CSV parsing entirely and a change to either rebuilds the
+    # file. It is written to a temporary name and renamed, so concurrent
+    # workers never see a half-written file.
+    digest = hashlib.sha1(inspect.getsource(prepare_data).encode())
+    with open(path, "rb") as f:
+        # Hashed in 1 MiB chunks so the CSV is never held in memory whole
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    stem = os.path.splitext(path)[0]
+    cache_path = f"{stem}.{digest.hexdigest()[:12]}.arrow"
+
+    if not os.path.exists(cache_path):
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        feather.write_feather(prepare_data(path), tmp_path, compression="uncompressed")
+        try:
+            os.replace(tmp_path, cache_path)
+        except PermissionError:
+            # Windows won't replace a file another worker already has mapped.
+            # That worker built the same contents, so keep its copy
+            if not os.path.exists(cache_path):
+                raise
+            os.remove(tmp_path)
+
+        # Caches built from an older CSV or prepare_data are never read again
+        for stale in glob.glob(f"{glob.escape(stem)}.????????????.arrow"):
+            if stale != cache_path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass  # still mapped elsewhere (Windows); a later build clears it
+
+    # Memory-mapped: under a multi-process server every worker maps the same
+    # file, so the numeric columns are views on the shared OS page cache rather
+    # than a private copy per worker
+    df = feather.read_table(cache_path, memory_map=True).to_pandas(split_blocks=True)
+
+    # The cache keeps integer ids as plain integers, so categorise after loading
+    df["customer_id"] = df["customer_id"].astype("category")
+    return df
+
+
+# =======================
+# Helpers
+# =======================
+def month_label(year_month):
+    """Format integer year * 12 + month keys as "YYYY-MM" strings."""
+    months_since_0 = year_month - 1
+    return (months_since_0 // 12).astype(str) + "-" + (months_since_0 % 12 + 1).astype(str).str.zfill(2)
+
+
+def lttb_indices(y, n_out):
+    """Row positions of the Largest-Triangle-Three-Buckets downsample of a series."""
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    # First and last points are always kept; the rest is split into buckets and
+    # each bucket keeps the point forming the largest triangle with the point
+    # kept before it and the average of the next bucket
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.append(np.linspace(1, n - 1, n_out - 1).astype(np.int64), n)
+    picked = [0]
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_x = np.arange(edges[i + 1], edges[i + 2]).mean()
+        next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        a = picked[-1]
+        xs = np.arange(lo, hi)
+        area = np.abs((a - next_x) * (y[lo:hi] - y[a]) - (a - xs) * (next_y - y[a]))
+        picked.append(lo + int(area.argmax()))
+    picked.append(n - 1)
+    return np.array(picked)
+
+
+def count_distinct(codes, n_categories):
+    """Number of distinct values among categorical codes, from a bitmap."""
+    # One extra slot absorbs the -1 code of missing values
+    seen = np.zeros(n_categories + 1, dtype=bool)
+    seen[codes] = True
+    return int(np.count_nonzero(seen[:-1]))
+
+
+def isin_codes(codes, categories, values):
+    """Membership mask for categorical codes, tested against the codes of values."""
+    wanted = categories.get_indexer(values)
+    return np.isin(codes, wanted[wanted >= 0])
\ No newline at end of file